@@ -1,64 +1,235 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sqlite3
-import pandas as pd
-from datetime import datetime
+import threading
+import atexit
+import queue
+import os
+import time
+import hashlib
+from functools import wraps
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # fall back to Flask's stdlib json encoder
+    orjson = None
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serialize jsonify() responses with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+app.json.sort_keys = False  # skip re-sorting every response's keys
 CORS(app)  # Enable CORS for frontend
 
+# Endpoints read the agg_* summary tables that data_preprocessing builds at
+# ingest, so request cost scales with the number of groups, not sales rows;
+# the GROUP BY work itself runs once per rebuild, not per request.
 DB_PATH = 'sales_data.db'
+# Touched by data_preprocessing.store_in_database whenever the data is rebuilt
+CACHE_SENTINEL = DB_PATH + '.mtime'
+CACHE_TTL = 30  # seconds
+CACHE_MAX_ENTRIES = 128
+POOL_SIZE = 8
 
-def get_db_connection():
-    """Create database connection"""
-    conn = sqlite3.connect(DB_PATH)
+# Bounded connection pool: each request checks one connection out and
+# returns it on teardown, so at most POOL_SIZE are ever open
+_pool = queue.Queue(maxsize=POOL_SIZE)
+_connections = []
+_connections_lock = threading.Lock()
+
+def _open_connection():
+    """Open a tuned, read-mostly connection to DB_PATH"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
+def get_db_connection():
+    """Return the current request's pooled connection, checking one out if needed"""
+    if 'db' not in g:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = None
+            with _connections_lock:
+                if len(_connections) < POOL_SIZE:
+                    conn = _open_connection()
+                    _connections.append(conn)
+            if conn is None:
+                # Pool exhausted; wait for another request to return one
+                conn = _pool.get()
+        g.db = conn
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        _pool.put(conn)
+
+@atexit.register
+def close_db_connections():
+    """Close all pooled connections on interpreter exit"""
+    with _connections_lock:
+        while _connections:
+            _connections.pop().close()
+
 def query_to_dict(query, params=()):
     """Execute query and return results as list of dicts"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    # Plain tuples are cheaper to zip than sqlite3.Row objects, and iterating
+    # the cursor avoids materializing an intermediate fetchall() list
+    cursor.row_factory = None
     cursor.execute(query, params)
     columns = [description[0] for description in cursor.description]
-    results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    conn.close()
+    results = [dict(zip(columns, row)) for row in cursor]
+    cursor.close()
     return results
 
+# In-process LRU response cache:
+# (path, param values) -> (timestamp, sentinel mtime, body)
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _data_version():
+    """Return the mtime of the cache sentinel, or 0 if it was never written"""
+    try:
+        return os.stat(CACHE_SENTINEL).st_mtime_ns
+    except OSError:
+        return 0
+
+def cached_response(params=(), ttl=CACHE_TTL):
+    """Cache an endpoint's JSON body per path and `params` values for `ttl` seconds"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Only the query args the view reads, so junk args can't add entries
+            key = (request.path, tuple(request.args.get(name) for name in params))
+            version = _data_version()
+            now = time.monotonic()
+            with _response_cache_lock:
+                entry = _response_cache.get(key)
+                if entry and entry[1] == version and now - entry[0] < ttl:
+                    _response_cache.move_to_end(key)
+                    return app.response_class(entry[2], mimetype='application/json')
+                if entry:
+                    # Expired or built from an older data version
+                    del _response_cache[key]
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                with _response_cache_lock:
+                    _response_cache[key] = (now, version, response.get_data())
+                    _response_cache.move_to_end(key)
+                    while len(_response_cache) > CACHE_MAX_ENTRIES:
+                        _response_cache.popitem(last=False)
+            return response
+        return wrapper
+    return decorator
+
+# Names of the agg_* summary tables, refreshed only when the data is rebuilt.
+# Ingest skips a table when the CSV lacks a column it needs.
+_summary_tables = (None, frozenset())
+
+def get_summary_tables():
+    """Return the names of the summary tables present as a frozenset"""
+    global _summary_tables
+    version = _data_version()
+    if _summary_tables[0] != version:
+        cursor = get_db_connection().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'agg%'")
+        _summary_tables = (version, frozenset(row[0] for row in cursor.fetchall()))
+        cursor.close()
+    return _summary_tables[1]
+
+# Conditional GETs: clients revalidate with If-None-Match and get a 304
+def _compute_etag():
+    """Derive an ETag from the database/sentinel mtimes and the request URL"""
+    try:
+        db_mtime = os.stat(DB_PATH).st_mtime_ns
+    except OSError:
+        db_mtime = 0
+    key = f"{db_mtime}:{_data_version()}:{request.full_path}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+@app.before_request
+def check_etag():
+    """Answer unchanged /api/* GETs with 304 before running the endpoint"""
+    if (request.method != 'GET' or not request.path.startswith('/api/')
+            or request.url_rule is None):
+        return None
+    g.etag = _compute_etag()
+    # Weak comparison, matching make_conditional in add_etag
+    if request.if_none_match.contains_weak(g.etag):
+        response = app.response_class(status=304)
+        response.set_etag(g.etag)
+        return response
+    return None
+
+@app.after_request
+def add_etag(response):
+    """Attach the ETag computed in check_etag to successful responses"""
+    etag = g.get('etag')
+    if etag and response.status_code == 200:
+        response.set_etag(etag)
+        response.make_conditional(request)
+    return response
+
 # API 1: Sales Over Time
 @app.route('/api/sales-over-time', methods=['GET'])
+@cached_response(params=('period',))
 def sales_over_time():
     """Get sales aggregated by time period"""
     period = request.args.get('period', 'month')  # day, month, quarter, year
     
+    table = {'day': 'agg_by_day', 'month': 'agg_by_month',
+             'quarter': 'agg_by_quarter'}.get(period, 'agg_by_year')
+    if table not in get_summary_tables():
+        return jsonify([{"message": "Sales over time data not available in dataset"}])
+    
     if period == 'day':
         query = """
-            SELECT ORDERDATE as date, SUM(SALES) as total_sales, COUNT(*) as order_count
-            FROM sales
-            GROUP BY ORDERDATE
+            SELECT ORDERDATE as date, total_sales, order_count
+            FROM agg_by_day
             ORDER BY ORDERDATE
         """
     elif period == 'month':
         query = """
             SELECT YEAR_ID || '-' || printf('%02d', MONTH_ID) as date, 
-                   SUM(SALES) as total_sales, COUNT(*) as order_count
-            FROM sales
-            GROUP BY YEAR_ID, MONTH_ID
+                   total_sales, order_count
+            FROM agg_by_month
             ORDER BY YEAR_ID, MONTH_ID
         """
     elif period == 'quarter':
         query = """
             SELECT YEAR_ID || '-Q' || QTR_ID as date, 
-                   SUM(SALES) as total_sales, COUNT(*) as order_count
-            FROM sales
-            GROUP BY YEAR_ID, QTR_ID
+                   total_sales, order_count
+            FROM agg_by_quarter
             ORDER BY YEAR_ID, QTR_ID
         """
     else:  # year
         query = """
-            SELECT YEAR_ID as date, SUM(SALES) as total_sales, COUNT(*) as order_count
-            FROM sales
-            GROUP BY YEAR_ID
+            SELECT YEAR_ID as date, total_sales, order_count
+            FROM agg_by_year
             ORDER BY YEAR_ID
         """
     
@@ -67,15 +238,15 @@ def sales_over_time():
 
 # API 2: Sales by Category (Status)
 @app.route('/api/sales-by-category', methods=['GET'])
+@cached_response()
 def sales_by_category():
     """Get sales by status/category"""
+    if 'agg_by_status' not in get_summary_tables():
+        return jsonify([{"message": "Status data not available in dataset"}])
+    
     query = """
-        SELECT STATUS as category, 
-               SUM(SALES) as total_sales,
-               COUNT(*) as order_count,
-               AVG(SALES) as avg_sales
-        FROM sales
-        GROUP BY STATUS
+        SELECT STATUS as category, total_sales, order_count, avg_sales
+        FROM agg_by_status
         ORDER BY total_sales DESC
     """
     results = query_to_dict(query)
@@ -83,22 +254,13 @@ def sales_by_category():
 
 # API 3: Sales by Country (if available)
 @app.route('/api/sales-by-country', methods=['GET'])
+@cached_response()
 def sales_by_country():
-    """Get sales by country - check if COUNTRY column exists"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if COUNTRY column exists
-    cursor.execute("PRAGMA table_info(sales)")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    if 'COUNTRY' in columns:
+    """Get sales by country - check if country data was ingested"""
+    if 'agg_by_country' in get_summary_tables():
         query = """
-            SELECT COUNTRY, 
-                   SUM(SALES) as total_sales,
-                   COUNT(*) as order_count
-            FROM sales
-            GROUP BY COUNTRY
+            SELECT COUNTRY, total_sales, order_count
+            FROM agg_by_country
             ORDER BY total_sales DESC
             LIMIT 10
         """
@@ -107,130 +269,109 @@ def sales_by_country():
         # Return mock data or empty if no country column
         results = [{"message": "Country data not available in dataset"}]
     
-    conn.close()
     return jsonify(results)
 
 # API 4: KPIs (Key Performance Indicators)
 @app.route('/api/kpis', methods=['GET'])
+@cached_response()
 def get_kpis():
     """Get key performance indicators"""
-    query = """
-        SELECT 
-            SUM(SALES) as total_revenue,
-            COUNT(DISTINCT ORDERNUMBER) as total_orders,
-            AVG(SALES) as avg_order_value,
-            SUM(QUANTITYORDERED) as total_quantity
-        FROM sales
-    """
-    results = query_to_dict(query)
+    tables = get_summary_tables()
+    if 'agg_kpis' not in tables:
+        return jsonify({"message": "KPI data not available in dataset"})
     
-    # Get status breakdown
-    status_query = """
-        SELECT STATUS, COUNT(*) as count
-        FROM sales
-        GROUP BY STATUS
+    # Totals and the status breakdown (as a JSON array) in one round trip
+    if 'agg_by_status' in tables:
+        status_breakdown = """
+               (SELECT json_group_array(json_object('STATUS', STATUS, 'count', order_count))
+                FROM (SELECT STATUS, order_count FROM agg_by_status ORDER BY STATUS)
+               )"""
+    else:
+        status_breakdown = "'[]'"
+    query = f"""
+        SELECT total_revenue, total_orders, avg_order_value, total_quantity,
+               {status_breakdown} as status_breakdown
+        FROM agg_kpis
     """
-    status_results = query_to_dict(status_query)
+    results = query_to_dict(query)
     
     kpis = results[0] if results else {}
-    kpis['status_breakdown'] = status_results
+    kpis['status_breakdown'] = app.json.loads(kpis.get('status_breakdown') or '[]')
     
     return jsonify(kpis)
 
 # API 5: Top Customers
 @app.route('/api/top-customers', methods=['GET'])
+@cached_response(params=('limit',))
 def top_customers():
     """Get top customers by sales"""
     limit = request.args.get('limit', 10, type=int)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if CUSTOMERNAME column exists
-    cursor.execute("PRAGMA table_info(sales)")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    if 'CUSTOMERNAME' in columns:
-        query = f"""
+    # Check if customer data was ingested
+    tables = get_summary_tables()
+    if 'agg_by_customer' in tables:
+        query = """
             SELECT CUSTOMERNAME as customer_name,
-                   SUM(SALES) as total_sales,
-                   COUNT(DISTINCT ORDERNUMBER) as order_count,
-                   AVG(SALES) as avg_order_value
-            FROM sales
-            GROUP BY CUSTOMERNAME
+                   total_sales, order_count, avg_order_value
+            FROM agg_by_customer
             ORDER BY total_sales DESC
-            LIMIT {limit}
+            LIMIT ?
         """
-        results = query_to_dict(query)
-    else:
+        results = query_to_dict(query, (limit,))
+    elif 'agg_by_order' in tables:
         # Group by order number if customer name not available
-        query = f"""
-            SELECT ORDERNUMBER as order_id,
-                   SUM(SALES) as total_sales,
-                   COUNT(*) as line_items
-            FROM sales
-            GROUP BY ORDERNUMBER
+        query = """
+            SELECT ORDERNUMBER as order_id, total_sales, line_items
+            FROM agg_by_order
             ORDER BY total_sales DESC
-            LIMIT {limit}
+            LIMIT ?
         """
-        results = query_to_dict(query)
+        results = query_to_dict(query, (limit,))
+    else:
+        results = [{"message": "Customer data not available in dataset"}]
     
-    conn.close()
     return jsonify(results)
 
 # API 6: Sales Trends
 @app.route('/api/sales-trends', methods=['GET'])
+@cached_response()
 def sales_trends():
     """Get sales trends with growth calculations"""
+    if 'agg_by_month' not in get_summary_tables():
+        return jsonify([{"message": "Monthly sales data not available in dataset"}])
+    
+    # Month-over-month growth via LAG; the first month (and any month after
+    # a zero-sales month) reports 0
     query = """
-        SELECT YEAR_ID, MONTH_ID,
-               SUM(SALES) as monthly_sales
-        FROM sales
-        GROUP BY YEAR_ID, MONTH_ID
+        SELECT YEAR_ID, MONTH_ID, total_sales as monthly_sales,
+               CASE WHEN LAG(total_sales) OVER w > 0
+                    THEN ROUND((total_sales - LAG(total_sales) OVER w) * 100.0
+                               / LAG(total_sales) OVER w, 2)
+                    ELSE 0
+               END as growth_rate
+        FROM agg_by_month
+        WINDOW w AS (ORDER BY YEAR_ID, MONTH_ID)
         ORDER BY YEAR_ID, MONTH_ID
     """
     results = query_to_dict(query)
-    
-    # Calculate month-over-month growth
-    for i in range(1, len(results)):
-        prev_sales = results[i-1]['monthly_sales']
-        curr_sales = results[i]['monthly_sales']
-        if prev_sales > 0:
-            growth = ((curr_sales - prev_sales) / prev_sales) * 100
-            results[i]['growth_rate'] = round(growth, 2)
-        else:
-            results[i]['growth_rate'] = 0
-    
-    if results:
-        results[0]['growth_rate'] = 0
-    
     return jsonify(results)
 
 # API 7: Product Performance
 @app.route('/api/product-performance', methods=['GET'])
+@cached_response()
 def product_performance():
     """Get product line performance if available"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("PRAGMA table_info(sales)")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    if 'PRODUCTLINE' in columns:
+    if 'agg_by_productline' in get_summary_tables():
         query = """
             SELECT PRODUCTLINE as product,
-                   SUM(SALES) as total_sales,
-                   SUM(QUANTITYORDERED) as total_quantity,
-                   COUNT(DISTINCT ORDERNUMBER) as order_count
-            FROM sales
-            GROUP BY PRODUCTLINE
+                   total_sales, total_quantity, order_count
+            FROM agg_by_productline
             ORDER BY total_sales DESC
         """
         results = query_to_dict(query)
     else:
         results = [{"message": "Product line data not available"}]
     
-    conn.close()
     return jsonify(results)
 
 # Health check endpoint
@@ -247,10 +388,16 @@ def get_schema():
     cursor = conn.cursor()
     cursor.execute("PRAGMA table_info(sales)")
     columns = cursor.fetchall()
-    conn.close()
+    cursor.close()
     
     schema = [{"name": col[1], "type": col[2]} for col in columns]
     return jsonify(schema)
 
+# Production: serve with several gunicorn workers, each with its own
+# SQLite connection pool (the database is read-only WAL, so safe to share):
+#
+#     gunicorn -w $(nproc) -k gthread --threads 4 -b 0.0.0.0:5001 app:app
+#
+# Running this file directly starts Flask's development server instead.
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5001, threaded=True)
\ No newline at end of file
@@ -5,53 +5,97 @@ import sqlite3
 import warnings
 warnings.filterwarnings('ignore')
 
+REQUIRED_COLUMNS = [
+    'ORDERNUMBER', 'QUANTITYORDERED', 'PRICEEACH',
+    'ORDERLINENUMBER', 'SALES', 'ORDERDATE', 
+    'STATUS', 'QTR_ID', 'MONTH_ID', 'YEAR_ID'
+]
+
+# Fixed read schema so pandas skips type inference; nullable integer
+# types keep missing values until handle_missing_data fills them
+CSV_DTYPES = {
+    'ORDERNUMBER': 'Int32',
+    'QUANTITYORDERED': 'Int16',
+    'PRICEEACH': 'float64',
+    'ORDERLINENUMBER': 'Int16',
+    'SALES': 'float64',
+    'QTR_ID': 'Int8',
+    'MONTH_ID': 'Int8',
+    'YEAR_ID': 'Int16',
+    'STATUS': 'category',
+    'ORDERDATE': 'string',
+}
+
+CHUNKSIZE = 200_000
+
+# Low-cardinality text columns kept as pandas categoricals
+CATEGORY_COLUMNS = ['STATUS', 'PRODUCTLINE', 'COUNTRY', 'CUSTOMERNAME']
+
 # Load the dataset
-def load_data(file_path):
-    """Load sales data from CSV file"""
-    df = pd.read_csv(file_path, encoding='latin1')
-    print(f"Initial shape: {df.shape}")
-    return df
+def load_data(file_path, chunksize=CHUNKSIZE):
+    """Lazily load sales data from CSV file, `chunksize` rows at a time"""
+    print(f"Reading {file_path} in chunks of {chunksize} rows")
+    return pd.read_csv(file_path, encoding='latin1', dtype=CSV_DTYPES,
+                       usecols=lambda col: col in REQUIRED_COLUMNS,
+                       chunksize=chunksize)
 
 # Step 1: Select required columns
 def select_columns(df):
     """Keep only required columns"""
-    required_cols = [
-        'ORDERNUMBER', 'QUANTITYORDERED', 'PRICEEACH',
-        'ORDERLINENUMBER', 'SALES', 'ORDERDATE', 
-        'STATUS', 'QTR_ID', 'MONTH_ID', 'YEAR_ID'
-    ]
-    
     # Check if columns exist
-    available_cols = [col for col in required_cols if col in df.columns]
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    available_cols = [col for col in REQUIRED_COLUMNS if col in df.columns]
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
     
     if missing_cols:
         print(f"Warning: Missing columns: {missing_cols}")
     
     df = df[available_cols].copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
     print(f"Shape after column selection: {df.shape}")
     return df
 
 # Step 2: Handle missing data
-def handle_missing_data(df):
+def handle_missing_data(df, verbose=False):
     """Handle missing values"""
-    print("\nMissing values before handling:")
-    print(df.isnull().sum())
+    # Single null scan; only columns with gaps are filled
+    null_counts = df.isnull().sum()
+    missing_cols = null_counts.index[null_counts > 0]
+    filled_cols = []
+    if verbose:
+        print("\nMissing values before handling:")
+        print(null_counts)
     
     # Fill numeric columns with median
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        if df[col].isnull().sum() > 0:
-            df[col].fillna(df[col].median(), inplace=True)
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.intersection(missing_cols)
+    if len(numeric_cols) > 0:
+        medians = df[numeric_cols].median().dropna()
+        # Integer columns can only take a whole-number fill value
+        int_cols = df[medians.index].select_dtypes(include=['integer']).columns
+        medians[int_cols] = medians[int_cols].round()
+        df[medians.index] = df[medians.index].fillna(medians)
+        filled_cols.extend(medians.index)
     
-    # Fill categorical columns with mode
-    categorical_cols = df.select_dtypes(include=['object']).columns
+    # Fill categorical columns with mode, taken as the idxmax of an unsorted
+    # value_counts rather than mode(), which sorts every unique value
+    categorical_cols = df.select_dtypes(
+        include=['object', 'string', 'category']).columns.intersection(missing_cols)
+    fill_values = {}
     for col in categorical_cols:
-        if df[col].isnull().sum() > 0:
-            df[col].fillna(df[col].mode()[0], inplace=True)
+        counts = df[col].value_counts(dropna=True, sort=False)
+        if len(counts) > 0 and counts.max() > 0:
+            fill_values[col] = counts.idxmax()
+    if fill_values:
+        fill_cols = list(fill_values)
+        df[fill_cols] = df[fill_cols].fillna(fill_values)
+        filled_cols.extend(fill_cols)
     
-    print("\nMissing values after handling:")
-    print(df.isnull().sum())
+    if verbose:
+        # Filled columns have no nulls left; no need to rescan the frame
+        null_counts[filled_cols] = 0
+        print("\nMissing values after handling:")
+        print(null_counts)
     return df
 
 # Step 3: Handle duplicates
@@ -64,20 +108,53 @@ def handle_duplicates(df):
     return df
 
 # Step 4: Normalize categories
+def normalize_labels(series):
+    """Strip and upper-case a categorical's labels, once per category"""
+    series = series.astype('category')
+    labels = series.cat.categories.str.strip().str.upper()
+    if labels.is_unique:
+        return series.cat.rename_categories(labels)
+    # Labels that collide after normalizing (e.g. 'Shipped' and 'SHIPPED ')
+    # have to be merged, which rename_categories cannot do
+    mapping = dict(zip(series.cat.categories, labels))
+    return series.map(mapping).astype('category')
+
 def normalize_categories(df):
     """Normalize categorical columns"""
     if 'STATUS' in df.columns:
-        df['STATUS'] = df['STATUS'].str.strip().str.upper()
+        df['STATUS'] = normalize_labels(df['STATUS'])
     
-    print("\nUnique STATUS values:", df['STATUS'].unique())
+    print("\nUnique STATUS values:", list(df['STATUS'].cat.categories))
     return df
 
 # Step 5: Extract date components
+# Known ORDERDATE layouts (Kaggle export first, then date-only)
+ORDERDATE_FORMATS = ['%m/%d/%Y %H:%M', '%m/%d/%Y']
+
+def detect_date_format(series):
+    """Return the first ORDERDATE_FORMATS entry matching the first non-null value"""
+    first = series.first_valid_index()
+    if first is None or not isinstance(series[first], str):
+        return None
+    for fmt in ORDERDATE_FORMATS:
+        try:
+            datetime.strptime(series[first].strip(), fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
 def extract_date_features(df):
     """Extract Year, Month, Quarter from ORDERDATE"""
     if 'ORDERDATE' in df.columns:
-        # Convert to datetime
-        df['ORDERDATE'] = pd.to_datetime(df['ORDERDATE'], errors='coerce')
+        # Convert to datetime; an explicit format skips per-row inference
+        dates = df['ORDERDATE']
+        date_format = detect_date_format(dates)
+        if date_format is not None:
+            # Parse the same stripped text the format was detected on
+            dates = dates.str.strip()
+        df['ORDERDATE'] = pd.to_datetime(dates, format=date_format,
+                                         errors='coerce', cache=True)
         
         # Extract components if not already present
         if 'YEAR_ID' not in df.columns:
@@ -107,37 +184,171 @@ def validate_data(df):
     
     return df
 
+# Indices on sales, each created only if all of its columns are present.
+# The composite ones cover the GROUP BY keys plus the summed columns so
+# the aggregations can be answered from the index alone.
+SALES_INDEXES = [
+    ('idx_orderdate', ['ORDERDATE']),
+    ('idx_status', ['STATUS']),
+    ('idx_year', ['YEAR_ID']),
+    ('idx_ym_sales', ['YEAR_ID', 'MONTH_ID', 'SALES']),
+    ('idx_yq_sales', ['YEAR_ID', 'QTR_ID', 'SALES']),
+    ('idx_status_sales', ['STATUS', 'SALES']),
+    ('idx_cust_sales', ['CUSTOMERNAME', 'ORDERNUMBER', 'SALES']),
+]
+
+# Summary tables materialized at ingest and read directly by the API
+# (table name, sales columns it reads, group key columns, SELECT over sales);
+# a table is skipped when any of the columns it reads is missing
+SUMMARY_TABLES = [
+    ('agg_by_day', ['ORDERDATE', 'SALES'], ['ORDERDATE'], """
+        SELECT ORDERDATE, SUM(SALES) as total_sales, COUNT(*) as order_count
+        FROM sales GROUP BY ORDERDATE
+    """),
+    ('agg_by_month', ['YEAR_ID', 'MONTH_ID', 'SALES'], ['YEAR_ID', 'MONTH_ID'], """
+        SELECT YEAR_ID, MONTH_ID, SUM(SALES) as total_sales, COUNT(*) as order_count
+        FROM sales GROUP BY YEAR_ID, MONTH_ID
+    """),
+    ('agg_by_quarter', ['YEAR_ID', 'QTR_ID', 'SALES'], ['YEAR_ID', 'QTR_ID'], """
+        SELECT YEAR_ID, QTR_ID, SUM(SALES) as total_sales, COUNT(*) as order_count
+        FROM sales GROUP BY YEAR_ID, QTR_ID
+    """),
+    ('agg_by_year', ['YEAR_ID', 'SALES'], ['YEAR_ID'], """
+        SELECT YEAR_ID, SUM(SALES) as total_sales, COUNT(*) as order_count
+        FROM sales GROUP BY YEAR_ID
+    """),
+    ('agg_by_status', ['STATUS', 'SALES'], ['STATUS'], """
+        SELECT STATUS, SUM(SALES) as total_sales, COUNT(*) as order_count,
+               AVG(SALES) as avg_sales
+        FROM sales GROUP BY STATUS
+    """),
+    ('agg_by_order', ['ORDERNUMBER', 'SALES'], ['ORDERNUMBER'], """
+        SELECT ORDERNUMBER, SUM(SALES) as total_sales, COUNT(*) as line_items
+        FROM sales GROUP BY ORDERNUMBER
+    """),
+    ('agg_kpis', ['SALES', 'ORDERNUMBER', 'QUANTITYORDERED'], [], """
+        SELECT SUM(SALES) as total_revenue,
+               COUNT(DISTINCT ORDERNUMBER) as total_orders,
+               AVG(SALES) as avg_order_value,
+               SUM(QUANTITYORDERED) as total_quantity
+        FROM sales
+    """),
+    ('agg_by_country', ['COUNTRY', 'SALES'], ['COUNTRY'], """
+        SELECT COUNTRY, SUM(SALES) as total_sales, COUNT(*) as order_count
+        FROM sales GROUP BY COUNTRY
+    """),
+    ('agg_by_productline', ['PRODUCTLINE', 'SALES', 'QUANTITYORDERED', 'ORDERNUMBER'], ['PRODUCTLINE'], """
+        SELECT PRODUCTLINE, SUM(SALES) as total_sales,
+               SUM(QUANTITYORDERED) as total_quantity,
+               COUNT(DISTINCT ORDERNUMBER) as order_count
+        FROM sales GROUP BY PRODUCTLINE
+    """),
+    ('agg_by_customer', ['CUSTOMERNAME', 'SALES', 'ORDERNUMBER'], ['CUSTOMERNAME'], """
+        SELECT CUSTOMERNAME, SUM(SALES) as total_sales,
+               COUNT(DISTINCT ORDERNUMBER) as order_count,
+               AVG(SALES) as avg_order_value
+        FROM sales GROUP BY CUSTOMERNAME
+    """),
+]
+
+def create_summary_tables(conn, columns):
+    """Materialize the API's aggregations from the sales table"""
+    cursor = conn.cursor()
+    for table, table_cols, keys, select in SUMMARY_TABLES:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        if not all(col in columns for col in table_cols):
+            print(f"Skipping {table}: missing columns "
+                  f"{[col for col in table_cols if col not in columns]}")
+            continue
+        cursor.execute(f'CREATE TABLE {table} AS {select}')
+        if keys:
+            cursor.execute(f'CREATE INDEX idx_{table} ON {table}({", ".join(keys)})')
+
+def remove_duplicate_rows(conn, columns):
+    """Drop rows duplicated across chunks, keeping the first occurrence"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        DELETE FROM sales WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM sales GROUP BY {", ".join(columns)}
+        )
+    """)
+    if cursor.rowcount > 0:
+        print(f"\nRemoved {cursor.rowcount} duplicate rows across chunks")
+
 # Step 7: Store in SQLite database
-def store_in_database(df, db_path='sales_data.db'):
-    """Store processed data in SQLite database"""
-    conn = sqlite3.connect(db_path)
+def store_in_database(chunks, db_path='sales_data.db'):
+    """Store processed data (a DataFrame or an iterable of chunks) in SQLite.
     
-    # Store main sales data
-    df.to_sql('sales', conn, if_exists='replace', index=False)
+    Returns the number of rows stored, after cross-chunk deduplication.
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
     
-    # Create indices for faster queries
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orderdate ON sales(ORDERDATE)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON sales(STATUS)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_year ON sales(YEAR_ID)')
+    bulk_mode = False
+    try:
+        # Bulk-load settings: the tables are rebuilt from scratch on every run,
+        # so skip journaling and fsyncs and hold the file lock until we are done.
+        # Leaving WAL mode fails while the API has the file open; in that case
+        # load in WAL mode without the exclusive lock.
+        cursor.execute('PRAGMA synchronous=OFF')
+        try:
+            cursor.execute('PRAGMA journal_mode=OFF')
+            cursor.execute('PRAGMA locking_mode=EXCLUSIVE')
+            bulk_mode = True
+        except sqlite3.OperationalError:
+            pass
+        
+        # Stream main sales data in chunk by chunk
+        cursor.execute('DROP TABLE IF EXISTS sales')
+        columns = []
+        for df in chunks:
+            df.to_sql('sales', conn, if_exists='append', index=False)
+            columns = df.columns
+        if len(columns) == 0:
+            raise ValueError("No data to store")
+        
+        remove_duplicate_rows(conn, columns)
+        row_count = cursor.execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+        
+        # Create indices for faster queries
+        for index, index_cols in SALES_INDEXES:
+            if all(col in columns for col in index_cols):
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON sales({", ".join(index_cols)})')
+        
+        # Precompute aggregations so the API reads groups instead of rows
+        create_summary_tables(conn, columns)
+        
+        # Refresh planner statistics so the new indices get picked
+        cursor.execute('ANALYZE')
+        conn.commit()
+    finally:
+        try:
+            if bulk_mode:
+                # Back to the settings the API connections expect
+                conn.rollback()  # no-op unless the load failed mid-transaction
+                cursor.execute('PRAGMA locking_mode=NORMAL')
+                cursor.execute('PRAGMA journal_mode=WAL')
+        finally:
+            conn.close()
     
-    conn.commit()
-    conn.close()
+    # Touch the sentinel so the API drops its cached responses
+    with open(db_path + '.mtime', 'w') as f:
+        f.write(datetime.now().isoformat())
     print(f"\nData stored in {db_path}")
+    return row_count
 
-# Main preprocessing pipeline
-def main(input_file, output_db='sales_data.db'):
-    """Main preprocessing pipeline"""
-    print("=== Starting Data Preprocessing ===\n")
-    
-    # Load data
-    df = load_data(input_file)
+# Per-chunk preprocessing steps
+def preprocess_chunk(df, verbose=False):
+    """Run steps 1-6 on a single chunk"""
+    print(f"\nChunk shape: {df.shape}")
     
     # Select columns
     df = select_columns(df)
     
     # Handle missing data
-    df = handle_missing_data(df)
+    df = handle_missing_data(df, verbose)
     
     # Handle duplicates
     df = handle_duplicates(df)
@@ -150,20 +361,23 @@ def main(input_file, output_db='sales_data.db'):
     
     # Validate data
     df = validate_data(df)
+    return df
+
+# Main preprocessing pipeline
+def main(input_file, output_db='sales_data.db', chunksize=CHUNKSIZE, verbose=False):
+    """Main preprocessing pipeline; returns the number of rows stored"""
+    print("=== Starting Data Preprocessing ===\n")
     
-    # Store in database
-    store_in_database(df, output_db)
-    
-    # Save processed CSV
-    output_csv = 'processed_sales_data.csv'
-    df.to_csv(output_csv, index=False)
-    print(f"\nProcessed data saved to {output_csv}")
+    # Load, preprocess and store in database one chunk at a time
+    processed_chunks = (preprocess_chunk(chunk, verbose)
+                        for chunk in load_data(input_file, chunksize))
+    row_count = store_in_database(processed_chunks, output_db)
     
     print("\n=== Preprocessing Complete ===")
-    return df
+    return row_count
 
 # Usage
 if __name__ == "__main__":
     # Replace with your actual file path
     input_file = 'sales_data.csv'
-    df = main(input_file)
\ No newline at end of file
+    main(input_file)
\ No newline at end of file